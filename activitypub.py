@@ -7,24 +7,40 @@ reuse.
 
 All functions return plain Python dictionaries ready to be serialized to JSON.
 """
-from typing import Any, Dict, List, Union
-
-
-def context() -> List[Union[str, Dict[str, str]]]:
-    """Return a list suitable for the @context of ActivityPub objects.
+import sys
+from typing import Any, Dict, List, Tuple
+
+# Fixed schema.org vocabulary keys, interned so that building offers here and
+# reading them back in the hub indexer hash/compare by identity.
+SCHEMA_NAME = sys.intern("schema:name")
+SCHEMA_DESCRIPTION = sys.intern("schema:description")
+SCHEMA_IMAGE = sys.intern("schema:image")
+SCHEMA_OFFERS = sys.intern("schema:offers")
+SCHEMA_PRICE = sys.intern("schema:price")
+SCHEMA_PRICE_CURRENCY = sys.intern("schema:priceCurrency")
+
+# Built once at import and shared by every activity. The outer sequence is a
+# tuple so it cannot be modified; the namespace map stays a plain dict because
+# neither json nor orjson can serialize a MappingProxyType. Treat it as
+# read-only: callers that need to customise the context must copy it first.
+_SCHEMA_NS: Dict[str, str] = {
+    "schema": "https://schema.org/",
+    "sec": "https://w3id.org/security#",
+    "ldp": "http://www.w3.org/ns/ldp#",
+    "fedmarket": "https://vocab.fedmarket.example#",
+}
+_CONTEXT: Tuple[str, Dict[str, str]] = ("https://www.w3.org/ns/activitystreams", _SCHEMA_NS)
+
+
+def context() -> Tuple[str, Dict[str, str]]:
+    """Return a sequence suitable for the @context of ActivityPub objects.
 
     The context includes standard ActivityStreams and abbreviations used by
     schema.org as well as a custom namespace for federated-market vocabulary.
+    The returned tuple is a shared module-level constant that serializes as a
+    JSON array; its namespace dict must not be mutated.
     """
-    return [
-        "https://www.w3.org/ns/activitystreams",
-        {
-            "schema": "https://schema.org/",
-            "sec": "https://w3id.org/security#",
-            "ldp": "http://www.w3.org/ns/ldp#",
-            "fedmarket": "https://vocab.fedmarket.example#",
-        },
-    ]
+    return _CONTEXT
 
 
 def activity_base(type_: str, actor: str) -> Dict[str, Any]:
@@ -42,7 +58,7 @@ def activity_base(type_: str, actor: str) -> Dict[str, Any]:
         the actual timestamp if required.
     """
     return {
-        "@context": context(),
+        "@context": _CONTEXT,
         "type": type_,
         "actor": actor,
         # Placeholder timestamp; production code should override with real time
@@ -70,13 +86,13 @@ def make_offer(actor: str, product: Dict[str, Any]) -> Dict[str, Any]:
     activity = activity_base("Offer", actor)
     activity["object"] = {
         "type": "schema:Product",
-        "schema:name": product["name"],
-        "schema:description": product["description"],
-        "schema:image": product.get("image"),
-        "schema:offers": {
+        SCHEMA_NAME: product["name"],
+        SCHEMA_DESCRIPTION: product["description"],
+        SCHEMA_IMAGE: product.get("image"),
+        SCHEMA_OFFERS: {
             "type": "schema:Offer",
-            "schema:price": product["price"],
-            "schema:priceCurrency": product.get("currency", "RUB"),
+            SCHEMA_PRICE: product["price"],
+            SCHEMA_PRICE_CURRENCY: product.get("currency", "RUB"),
             "schema:availability": "https://schema.org/InStock",
         },
     }
@@ -84,13 +100,23 @@ def make_offer(actor: str, product: Dict[str, Any]) -> Dict[str, Any]:
     tags = product.get("tags", ["handmade"])  # sensible default
     if isinstance(tags, str):
         tags = [tags]
-    activity["tag"] = (
-        [{"type": "Hashtag", "name": "#market"}]
-        + [{"type": "Hashtag", "name": f"#{tag}"} for tag in tags]
-    )
+    activity["tag"] = _build_tag_list(tags)
     return activity
 
 
+def _build_tag_list(tags: List[str]) -> List[Dict[str, str]]:
+    """Convert plain tag names to Hashtag objects, prefixed with '#market'.
+
+    Builds a single output list in one pass instead of concatenating two
+    intermediate lists.
+    """
+    result = [{"type": "Hashtag", "name": "#market"}]
+    append = result.append
+    for tag in tags:
+        append({"type": "Hashtag", "name": f"#{tag}"})
+    return result
+
+
 def make_trust(actor: str, target: str, weight: float) -> Dict[str, Any]:
     """Construct a custom Trust activity linking actor to target with weight.
 
@@ -103,7 +129,7 @@ def make_trust(actor: str, target: str, weight: float) -> Dict[str, Any]:
         A federated-market Trust activity as a dictionary.
     """
     return {
-        "@context": context(),
+        "@context": _CONTEXT,
         "type": "fedmarket:Trust",
         "actor": actor,
         "object": {
@@ -114,3 +140,4 @@ def make_trust(actor: str, target: str, weight: float) -> Dict[str, Any]:
         },
         "published": "2025-04-05T12:00:00Z",
     }
+
@@ -8,6 +8,9 @@ import os
 # Database configuration
 MONGODB_URI: str = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
 DATABASE_NAME: str = "ozodon"
+# Connection pool sizing and server selection timeout for the shared client
+MONGODB_MAX_POOL_SIZE: int = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
 
 # Hub mode controls whether hub routes/UI are enabled
 HUB_MODE: bool = os.getenv("HUB_MODE", "false").lower() == "true"
@@ -22,3 +25,6 @@ TON_WALLET_MNEMONIC: list[str] = os.getenv("TON_WALLET_MNEMONIC", "").split()
 
 # Path to the registry of hubs that this node may replicate to
 HUBS_FILE: str = "hubs.json"
+
+# Optional Redis for shared response caching; empty -> in-process cache
+REDIS_URL: str = os.getenv("REDIS_URL", "")
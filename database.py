@@ -1,24 +1,91 @@
 """Database client initialization for Ozodon.
 
 Exposes a Motor AsyncIOMotorClient and database handle for reuse. Includes a
-simple readiness check used during application startup.
+simple readiness check and index bootstrap used during application startup.
 """
+import logging
+
 from motor.motor_asyncio import AsyncIOMotorClient
 
-from config import DATABASE_NAME, MONGODB_URI
+from config import (
+    DATABASE_NAME,
+    MONGODB_MAX_POOL_SIZE,
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+    MONGODB_URI,
+)
+
+log = logging.getLogger("ozodon.db")
 
-client = AsyncIOMotorClient(MONGODB_URI)
+# Single client (and connection pool) shared by the whole application
+client = AsyncIOMotorClient(
+    MONGODB_URI,
+    maxPoolSize=MONGODB_MAX_POOL_SIZE,
+    serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+    uuidRepresentation="standard",
+)
 db = client[DATABASE_NAME]
 
 
 async def ping_db() -> None:
     """Ping the MongoDB server to verify connectivity.
 
-    Prints a human-friendly message to stdout; errors are caught and displayed
-    without raising to avoid crashing the app on non-critical startup checks.
+    Logs a human-friendly message; errors are caught and logged without raising
+    to avoid crashing the app on non-critical startup checks.
     """
     try:
         await client.admin.command("ping")
-        print("✅ Подключение к MongoDB успешно")
+        log.info("✅ Подключение к MongoDB успешно")
     except Exception as e:
-        print(f"❌ Ошибка: {e}")
+        log.error("❌ Ошибка: %s", e)
+
+
+# (collection, index keys, create_index options) created at startup; each
+# failure is isolated so one conflicting index does not block the rest.
+_INDEXES = [
+    # Offer and deal lookups by their public ids are point seeks
+    ("hub_offers", [("id", 1)], {"unique": True}),
+    ("hub_deals", [("deal_id", 1)], {"unique": True}),
+    ("hub_offers_source", [("id", 1)], {"unique": True}),
+    # Latest-first feeds/timelines sort on published
+    ("hub_offers", [("published", -1)], {}),
+    # search_products keyword queries ($text), ranked by field weights
+    (
+        "hub_offers",
+        [("name", "text"), ("description", "text"), ("tags", "text")],
+        {"name": "offers_text", "weights": {"name": 10, "tags": 5, "description": 1}},
+    ),
+    # Anchored prefix regex fallback of search_products
+    ("hub_offers", [("name_lower", 1)], {}),
+    ("hub_offers", [("description_lower", 1)], {}),
+    # Word-prefix lookups of short substring queries (multikey)
+    ("hub_offers", [("phraselist", 1)], {}),
+    # Candidate pre-filter of substring search (multikey)
+    ("hub_offers", [("trigrams", 1)], {}),
+    # Price range filters of search_products
+    ("hub_offers", [("price", 1)], {}),
+    # search_products sorts by the stored rank_score, alone or within a tag;
+    # the compound index also serves every other equality lookup on tags
+    ("hub_offers", [("rank_score", 1)], {}),
+    ("hub_offers", [("tags", 1), ("rank_score", 1)], {}),
+    # Seller pages: equality on seller, newest first (index-ordered, no SORT)
+    ("hub_offers", [("seller", 1), ("published", -1)], {}),
+    # index_trust upserts by (source, target)
+    ("hub_trust_log", [("source", 1), ("target", 1)], {}),
+    # Per-target score recomputation after bulk trust writes
+    ("hub_trust_log", [("target", 1)], {}),
+    # trust_service: direct-edge lookups and $graphLookup hops (source prefix)
+    ("trust_log", [("source", 1), ("target", 1)], {"unique": True}),
+]
+
+
+async def ensure_indexes() -> None:
+    """Create the indexes hot read paths rely on.
+
+    create_index is idempotent, so this is safe to run on every startup. Errors
+    are logged but not raised, mirroring ping_db.
+    """
+    for collection, keys, options in _INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            log.error("❌ Ошибка создания индекса %s %s: %s", collection, keys, e)
@@ -0,0 +1,48 @@
+"""Logging setup for Ozodon.
+
+Records of the ``ozodon.*`` loggers are only enqueued by the calling coroutine;
+a QueueListener thread formats them and writes them to stderr, so a slow
+stdout/stderr never blocks the event loop.
+"""
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# Handler and listener installed by start_logging, if it is active
+_handler: QueueHandler | None = None
+_listener: QueueListener | None = None
+
+
+def start_logging(level: int = logging.INFO) -> None:
+    """Attach a queue-backed handler to the ``ozodon`` logger and start it.
+
+    Idempotent: repeated startups in one process (reload, test clients) reuse
+    the running listener instead of stacking handlers.
+    """
+    global _handler, _listener
+    if _listener is not None:
+        return
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _listener = QueueListener(records, handler, respect_handler_level=True)
+    _handler = QueueHandler(records)
+
+    logger = logging.getLogger("ozodon")
+    logger.setLevel(level)
+    logger.addHandler(_handler)
+    # Records are handled by the listener only, not again by root handlers
+    logger.propagate = False
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Detach the queue handler and stop the listener, flushing pending records."""
+    global _handler, _listener
+    if _listener is None:
+        return
+    logger = logging.getLogger("ozodon")
+    logger.removeHandler(_handler)
+    logger.propagate = True
+    _listener.stop()
+    _handler = _listener = None
@@ -6,17 +6,43 @@ mounts routers, and exposes ActivityPub-compatible and helper endpoints.
 All route handlers include docstrings for clarity and to comply with strict
 Python documentation standards.
 """
+import asyncio
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict
+from urllib.parse import urlsplit
+
 import config as config
+import orjson
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 
+from database import db, ensure_indexes, ping_db
+from logging_config import start_logging, stop_logging
 from routes.hub import router as hub_router
 from routes.web import router as web_router
-from services.hub_service import replicate_to_peers
+from services import cache_service
+from services.hub_service import (
+    OFFER_CARD_PROJECTION,
+    backfill_search_fields,
+    close_client,
+    ensure_rank_scores,
+    index_offer,
+    index_trust,
+    migrate_offer_sources,
+    rebuild_trust_scores,
+    replicate_to_peers,
+    search_products,
+)
+
+# orjson serializes straight to bytes and is several times faster than the
+# stdlib encoder FastAPI uses by default for plain dict responses.
+app = FastAPI(title="Ozodon", default_response_class=ORJSONResponse)
 
-app = FastAPI(title="Ozodon")
+log = logging.getLogger("ozodon")
 
 # Configure permissive CORS for demo purposes. In production, restrict origins.
 app.add_middleware(
@@ -26,9 +52,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Database client for global access within this module
-client = AsyncIOMotorClient(config.MONGODB_URI)
-db = client[config.DATABASE_NAME]
+# Host part of our public domain, used to answer WebFinger only for local accts
+_HUB_HOST = urlsplit(config.HUB_DOMAIN).netloc
 
 # Mount hub-specific routers and static files when the app runs in HUB_MODE.
 if config.HUB_MODE:
@@ -41,17 +66,81 @@ if config.HUB_MODE:
     app.include_router(web_router)
 
 
+async def _prepare_db() -> None:
+    """Create indexes and backfill derived hub data.
+
+    Runs in the background so a slow migration or an unreachable MongoDB does
+    not block startup; failures are logged, mirroring ping_db. Read paths that
+    depend on an index fall back to an unindexed query until it exists.
+    """
+    await ensure_indexes()
+    if not config.HUB_MODE:
+        return
+    try:
+        # Backfill precomputed trust scores for logs indexed before they existed
+        if not await db.hub_trust_scores.estimated_document_count():
+            await rebuild_trust_scores()
+        # Backfill derived fields for offers indexed before they existed
+        await backfill_search_fields()
+        await migrate_offer_sources()
+        await ensure_rank_scores()
+    except Exception as e:
+        log.error("❌ Ошибка миграции данных хаба: %s", e)
+    # Drop scores and search results cached from not yet backfilled data
+    await asyncio.gather(cache_service.clear("trust"), cache_service.clear("offers"))
+
+
 @app.on_event("startup")
 async def startup() -> None:
-    """Perform startup checks and log hub status if applicable."""
-    from database import ping_db
+    """Perform startup checks and log hub status if applicable.
 
-    await ping_db()
+    The connectivity ping, index creation and data backfills run in the
+    background instead of delaying the moment the server starts accepting
+    traffic.
+    """
+    start_logging()
+    app.state.ping_task = asyncio.create_task(ping_db())
+    app.state.prepare_db_task = asyncio.create_task(_prepare_db())
     if config.HUB_MODE:
-        print(f"🌍 Хаб включён: {config.HUB_DOMAIN}")
+        log.info("🌍 Хаб включён: %s", config.HUB_DOMAIN)
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    """Release shared connections held by the response cache and replication."""
+    await asyncio.gather(cache_service.close(), close_client())
+    # Flush queued log records
+    stop_logging()
 
 
 # --- ActivityPub generic inbox ---
+async def _index_and_replicate(indexed: Awaitable[Any], activity: dict) -> None:
+    """Replicate an activity to peer hubs once its local index write succeeded.
+
+    Peers only ever receive activities this hub has stored: a malformed
+    activity or a failed write raises before replication starts.
+    """
+    await indexed
+    await replicate_to_peers(activity)
+
+
+async def _handle_offer(activity: dict) -> None:
+    """Index an Offer locally, then replicate it to peer hubs."""
+    await _index_and_replicate(index_offer(activity), activity)
+
+
+async def _handle_trust(activity: dict) -> None:
+    """Index a fedmarket:Trust link locally, then replicate it to peer hubs."""
+    await _index_and_replicate(index_trust(activity), activity)
+
+
+# Activity type -> handler, resolved once at import. Outside HUB_MODE nothing
+# is indexed, so the table stays empty and every activity is just acknowledged.
+_HANDLERS: Dict[str, Callable[[dict], Awaitable[None]]] = (
+    {"Offer": _handle_offer, "fedmarket:Trust": _handle_trust} if config.HUB_MODE else {}
+)
+
+
 @app.post("/inbox")
 async def inbox(activity: dict) -> dict:
     """Accept arbitrary ActivityPub activities and index relevant ones.
@@ -59,27 +148,29 @@ async def inbox(activity: dict) -> dict:
     For Offer and fedmarket:Trust activities in HUB_MODE, index locally and
     replicate to known peers.
     """
-    atype = activity.get("type")
-
-    if atype == "Offer" and config.HUB_MODE:
-        from services.hub_service import index_offer
-
-        await index_offer(activity)
-        await replicate_to_peers(activity)
+    handler = _HANDLERS.get(activity.get("type"))
+    if handler is not None:
+        await handler(activity)
+    return {"status": "received"}
 
-    elif atype == "fedmarket:Trust" and config.HUB_MODE:
-        from services.hub_service import index_trust
 
-        await index_trust(activity)
-        await replicate_to_peers(activity)
+# --- ActivityPub user stubs ---
+# Collection placeholders are identical for every user, so they are built once.
+_EMPTY_OUTBOX = {
+    "@context": ["https://www.w3.org/ns/activitystreams"],
+    "type": "OrderedCollection",
+    "totalItems": 0,
+    "orderedItems": [],
+}
+_EMPTY_COLLECTION = {"type": "OrderedCollection", "totalItems": 0, "orderedItems": []}
 
-    return {"status": "received"}
 
+@lru_cache(maxsize=2048)
+def _user_profile_dict(username: str) -> dict:
+    """Build (and memoize) the Person object for a username.
 
-# --- ActivityPub user stubs ---
-@app.get("/users/{username}")
-async def user_profile(username: str) -> dict:
-    """Return a minimal ActivityPub Person object for a username."""
+    The returned dict is shared between requests and must not be mutated.
+    """
     actor_id = f"{config.HUB_DOMAIN}/users/{username}"
     return {
         "@context": ["https://www.w3.org/ns/activitystreams"],
@@ -94,6 +185,12 @@ async def user_profile(username: str) -> dict:
     }
 
 
+@app.get("/users/{username}")
+async def user_profile(username: str) -> dict:
+    """Return a minimal ActivityPub Person object for a username."""
+    return _user_profile_dict(username)
+
+
 @app.post("/users/{username}/inbox")
 async def user_inbox(username: str, activity: dict) -> dict:
     """Delegate per-user inbox to the generic inbox for indexing."""
@@ -103,29 +200,28 @@ async def user_inbox(username: str, activity: dict) -> dict:
 @app.get("/users/{username}/outbox")
 async def user_outbox(username: str) -> dict:
     """Return an empty outbox placeholder for compatibility."""
-    return {
-        "@context": ["https://www.w3.org/ns/activitystreams"],
-        "type": "OrderedCollection",
-        "totalItems": 0,
-        "orderedItems": [],
-    }
+    return _EMPTY_OUTBOX
 
 
 @app.get("/users/{username}/followers")
 async def user_followers(username: str) -> dict:
     """Return an empty followers collection placeholder."""
-    return {"type": "OrderedCollection", "totalItems": 0, "orderedItems": []}
+    return _EMPTY_COLLECTION
 
 
 @app.get("/users/{username}/following")
 async def user_following(username: str) -> dict:
     """Return an empty following collection placeholder."""
-    return {"type": "OrderedCollection", "totalItems": 0, "orderedItems": []}
+    return _EMPTY_COLLECTION
 
 
 # --- WebFinger ---
+# acct:username@domain, parsed in a single precompiled match
+_ACCT_RE = re.compile(r"acct:([^@]+)@(.+)")
+
+
 @app.get("/.well-known/webfinger")
-async def webfinger(resource: str) -> JSONResponse:
+async def webfinger(resource: str) -> ORJSONResponse:
     """Serve a simple WebFinger endpoint for local users.
 
     Args:
@@ -133,20 +229,18 @@ async def webfinger(resource: str) -> JSONResponse:
     """
     if not resource.startswith("acct:"):
         raise HTTPException(status_code=400, detail="Unsupported resource")
-    try:
-        acct = resource.split(":", 1)[1]
-        username, domain = acct.split("@", 1)
-    except Exception:  # invalid input shape
+    m = _ACCT_RE.fullmatch(resource)
+    if m is None:  # invalid input shape
         raise HTTPException(status_code=400, detail="Invalid acct")
+    username, domain = m.group(1), m.group(2)
 
     # Only answer for our domain; otherwise return 404
-    hub_domain = config.HUB_DOMAIN.replace("https://", "").replace("http://", "")
-    if domain != hub_domain:
+    if domain != _HUB_HOST:
         raise HTTPException(status_code=404)
 
     subject = f"acct:{username}@{domain}"
     actor = f"{config.HUB_DOMAIN}/users/{username}"
-    return JSONResponse(
+    return ORJSONResponse(
         {
             "subject": subject,
             "links": [
@@ -158,10 +252,16 @@ async def webfinger(resource: str) -> JSONResponse:
 
 
 # --- NodeInfo ---
-@app.get("/.well-known/nodeinfo")
-async def nodeinfo_index() -> dict:
-    """Return NodeInfo index pointing at the 2.0 schema."""
-    return {
+# NodeInfo is polled frequently by federation crawlers; counters are refreshed
+# at most once per TTL window instead of on every hit.
+_NODEINFO_TTL_SECONDS = 30.0
+_nodeinfo_cache = {"t": 0.0, "offers": 0, "trust": 0, "body": b""}
+
+# Discovery responses are static or change at most once per TTL window, so
+# their JSON bodies and headers are serialized ahead of time.
+_NODEINFO_HEADERS = {"Cache-Control": f"public, max-age={int(_NODEINFO_TTL_SECONDS)}"}
+_NODEINFO_INDEX_BODY = orjson.dumps(
+    {
         "links": [
             {
                 "rel": "http://nodeinfo.diaspora.software/ns/schema/2.0",
@@ -169,42 +269,83 @@ async def nodeinfo_index() -> dict:
             }
         ]
     }
+)
+
+
+def _render_nodeinfo(offers: int, trust_links: int) -> bytes:
+    """Serialize the NodeInfo 2.0 document for the given counters."""
+    return orjson.dumps(
+        {
+            "version": "2.0",
+            "software": {"name": "ozodon", "version": "0.1"},
+            "protocols": ["activitypub"],
+            "services": {"inbound": [], "outbound": []},
+            "openRegistrations": False,
+            "usage": {
+                "users": {"total": 1},
+                "localPosts": offers,
+            },
+            "metadata": {
+                "hub": {
+                    "name": config.HUB_NAME,
+                    "domain": config.HUB_DOMAIN,
+                    "description": config.HUB_DESCRIPTION,
+                    "offers": offers,
+                    "trust_links": trust_links,
+                }
+            },
+        }
+    )
+
+
+async def _nodeinfo_body() -> bytes:
+    """Return the cached NodeInfo body, refreshing counters when stale.
+
+    Uses estimated_document_count(), which reads collection metadata instead of
+    scanning documents; approximate numbers are fine for NodeInfo. The body is
+    re-serialized only when the counters are refreshed.
+    """
+    now = time.monotonic()
+    if not _nodeinfo_cache["body"] or now - _nodeinfo_cache["t"] > _NODEINFO_TTL_SECONDS:
+        if config.HUB_MODE:
+            _nodeinfo_cache["offers"] = await db.hub_offers.estimated_document_count()
+            _nodeinfo_cache["trust"] = await db.hub_trust_log.estimated_document_count()
+        _nodeinfo_cache["body"] = _render_nodeinfo(_nodeinfo_cache["offers"], _nodeinfo_cache["trust"])
+        _nodeinfo_cache["t"] = now
+    return _nodeinfo_cache["body"]
+
+
+@app.get("/.well-known/nodeinfo")
+async def nodeinfo_index() -> Response:
+    """Return NodeInfo index pointing at the 2.0 schema."""
+    return Response(_NODEINFO_INDEX_BODY, media_type="application/json", headers=_NODEINFO_HEADERS)
 
 
 @app.get("/nodeinfo/2.0")
-async def nodeinfo() -> dict:
+async def nodeinfo() -> Response:
     """Return a minimal NodeInfo 2.0 payload with hub metadata."""
-    offers = await db.hub_offers.count_documents({}) if config.HUB_MODE else 0
-    trust_links = await db.hub_trust_log.count_documents({}) if config.HUB_MODE else 0
-    return {
-        "version": "2.0",
-        "software": {"name": "ozodon", "version": "0.1"},
-        "protocols": ["activitypub"],
-        "services": {"inbound": [], "outbound": []},
-        "openRegistrations": False,
-        "usage": {
-            "users": {"total": 1},
-            "localPosts": offers,
-        },
-        "metadata": {
-            "hub": {
-                "name": config.HUB_NAME,
-                "domain": config.HUB_DOMAIN,
-                "description": config.HUB_DESCRIPTION,
-                "offers": offers,
-                "trust_links": trust_links,
-            }
-        },
-    }
+    return Response(await _nodeinfo_body(), media_type="application/json", headers=_NODEINFO_HEADERS)
 
 
 # --- Public timeline (latest offers) ---
 @app.get("/timeline/public")
-async def timeline_public(limit: int = 20) -> dict:
-    """Return a simple public timeline of latest offers."""
-    cursor = db.hub_offers.find({}).sort("published", -1).limit(limit)
-    items = await cursor.to_list(length=limit)
-    return {"items": items, "limit": limit}
+async def timeline_public(limit: int = 20) -> StreamingResponse:
+    """Return a simple public timeline of latest offers.
+
+    Documents are serialized one by one as the cursor yields them, so the full
+    result list is never materialized in memory.
+    """
+    cursor = db.hub_offers.find({}, OFFER_CARD_PROJECTION).sort("published", -1).limit(limit)
+
+    async def _stream():
+        yield b'{"items":['
+        first = True
+        async for doc in cursor:
+            yield (b"" if first else b",") + orjson.dumps(doc, default=str)
+            first = False
+        yield b'],"limit":%d}' % limit
+
+    return StreamingResponse(_stream(), media_type="application/json")
 
 
 # --- Simple API ---
@@ -215,6 +356,7 @@ async def api_products(
     min_price: float | None = None,
     max_price: float | None = None,
     limit: int = 20,
+    substring: bool = False,
 ) -> dict:
     """Search products via the service layer and return results.
 
@@ -224,8 +366,7 @@ async def api_products(
         min_price: Minimum price filter.
         max_price: Maximum price filter.
         limit: Maximum number of items to return.
+        substring: Match q inside names/descriptions instead of as keywords.
     """
-    from services.hub_service import search_products
-
-    results = await search_products(q, tag, min_price, max_price, limit)
+    results = await search_products(q, tag, min_price, max_price, limit, substring)
     return {"results": results}
@@ -0,0 +1,28 @@
+"""Conditional GET helpers shared by hub and web routes.
+
+Feed, tag and search pages change rarely between polls. Responses carry a weak
+ETag derived from the body so that pollers sending If-None-Match receive an
+empty 304 instead of the full payload.
+"""
+import hashlib
+
+from fastapi import Request
+from fastapi.responses import Response
+
+CACHE_CONTROL = "public, max-age=30, stale-while-revalidate=60"
+
+
+def conditional_response(request: Request, body: bytes, media_type: str = "application/json") -> Response:
+    """Return body with ETag/Cache-Control, or 304 if the client copy matches.
+
+    Args:
+        request: Incoming request, inspected for If-None-Match.
+        body: Fully serialized response body.
+        media_type: Content type of body.
+    """
+    etag = f'W/"{hashlib.sha256(body).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
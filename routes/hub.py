@@ -4,41 +4,76 @@ These endpoints are available only when HUB_MODE is enabled. The router exposes
 inbox processing, search, simple trust scoring, tag/category stats, and basic
 hub info suited for lightweight federation scenarios.
 """
+import asyncio
 from typing import Any, Dict
 from datetime import datetime, timedelta, timezone
 
-from fastapi import APIRouter, HTTPException
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
 
 import config
 from database import db
-from services.hub_service import index_offer, index_trust, load_hubs, search_products
+from routes.etag import conditional_response
+from services.cache_service import cached, stale_while_revalidate
+from services.hub_service import (
+    OFFER_CARD_PROJECTION,
+    get_offer_source,
+    index_offer,
+    index_trust,
+    load_hubs,
+    search_products,
+)
 from services.ton_payment import TONPaymentService, confirm_delivery, request_refund
 
-router = APIRouter(prefix="/hub", tags=["hub"], include_in_schema=False)
-
-# Reuse a single service instance
-_payment_service = TONPaymentService()
+# HUB_MODE is fixed for the lifetime of the process
+_HUB_ENABLED = bool(config.HUB_MODE)
 
 
 def check_enabled() -> None:
     """Guard endpoint access when HUB_MODE is disabled.
 
+    Registered once as a router-level dependency, so it runs before every hub
+    endpoint without per-handler calls.
+
     Raises:
         HTTPException: 404 to mimic absence of hub endpoints entirely.
     """
-    if not config.HUB_MODE:
+    if not _HUB_ENABLED:
         raise HTTPException(status_code=404)
 
 
-@router.post("/inbox")
-async def hub_inbox(activity: dict) -> dict:
-    """Index incoming activities relevant to the hub (Offer/Trust)."""
-    check_enabled()
+router = APIRouter(
+    prefix="/hub",
+    tags=["hub"],
+    include_in_schema=False,
+    dependencies=[Depends(check_enabled)],
+    # Явно: ответы хаба кодируются orjson независимо от настроек приложения
+    default_response_class=ORJSONResponse,
+)
+
+# Reuse a single service instance
+_payment_service = TONPaymentService()
+
+# Для проверки перехода состояния сделки достаточно статуса и товара
+_DEAL_STATE_PROJECTION = {"_id": 0, "status": 1, "product_id": 1}
+
+
+async def _dispatch(activity: dict) -> None:
+    """Index an activity relevant to the hub (Offer/Trust); ignore the rest."""
     atype = activity.get("type")
     if atype == "Offer":
         await index_offer(activity)
     elif atype == "fedmarket:Trust":
         await index_trust(activity)
+
+
+@router.post("/inbox")
+async def hub_inbox(activity: dict) -> dict:
+    """Index incoming activities relevant to the hub (Offer/Trust)."""
+    await _dispatch(activity)
     return {"status": "indexed"}
 
 
@@ -49,107 +84,167 @@ async def search(
     min_price: float | None = None,
     max_price: float | None = None,
     limit: int = 20,
+    substring: bool = False,
 ) -> dict:
-    """Search products indexed by the hub with optional filters."""
-    check_enabled()
-    results = await search_products(q, tag, min_price, max_price, limit)
+    """Search products indexed by the hub with optional filters.
+
+    With substring set, q is matched inside names and descriptions instead of
+    as whole keywords.
+    """
+    results = await search_products(q, tag, min_price, max_price, limit, substring)
     return {"results": results}
 
 
-@router.get("/trust/score")
-async def trust_score(actor: str) -> Dict[str, Any]:
+@cached(namespace="trust", expire=300)
+async def get_trust_cached(actor: str) -> Dict[str, Any]:
     """Простейший расчёт репутации на основе входящих связей доверия.
 
-    Если входящих нет — возвращаем 0.5 как нейтральный балл.
+    Сумма и число входящих весов поддерживаются при записи (index_trust) в
+    hub_trust_scores, поэтому чтение — один поиск по _id. Если входящих нет —
+    возвращаем 0.5 как нейтральный балл. Результат кэшируется на 5 минут и
+    сбрасывается при индексации новых связей доверия.
     """
-    check_enabled()
-    pipeline = [
-        {"$match": {"target": actor}},
-        {"$group": {"_id": "$target", "avg_weight": {"$avg": "$weight"}, "count": {"$sum": 1}}},
-    ]
-    agg = await db.hub_trust_log.aggregate(pipeline).to_list(length=1)
-    if agg:
-        score = float(agg[0].get("avg_weight", 0.5))
-        count = int(agg[0].get("count", 0))
-    else:
-        score, count = 0.5, 0
+    doc = await db.hub_trust_scores.find_one({"_id": actor})
+    count = int(doc.get("count", 0)) if doc else 0
+    score = float(doc["sum"]) / count if count else 0.5
     return {"actor": actor, "score": score, "votes": count}
 
 
+@router.get("/trust/score")
+async def trust_score(actor: str) -> Dict[str, Any]:
+    """Return the (cached) reputation score of an actor."""
+    return await get_trust_cached(actor)
+
+
 @router.get("/hubs")
+@cached(namespace="hubs", expire=60)
 async def list_hubs() -> list[dict]:
     """Return the static registry of hubs to replicate to."""
-    check_enabled()
     return load_hubs()
 
 
 @router.get("/seller/{actor_id}")
 async def seller(actor_id: str) -> dict:
     """Return seller's offers and a simple trust score summary."""
-    check_enabled()
-    offers = (
-        await db.hub_offers.find({"seller": actor_id}).sort("published", -1).limit(100).to_list(length=100)
+    # batch_size equal to the limit fetches all offers in one round trip; the
+    # trust score (from cache) is independent and is awaited concurrently
+    offers, score_doc = await asyncio.gather(
+        _seller_offers(actor_id),
+        get_trust_cached(actor_id),
     )
-    # Получим базовый скор (перевызов обработчика безопасен)
-    score_doc = await trust_score(actor_id)
     return {"seller": actor_id, "trust": score_doc, "offers": offers}
 
 
-@router.get("/feeds/latest")
-async def feeds_latest(limit: int = 20) -> dict:
-    """Return the latest offers feed."""
-    check_enabled()
-    cursor = db.hub_offers.find({}).sort("published", -1).limit(limit)
+async def _seller_offers(actor_id: str) -> list[dict]:
+    """Return a seller's latest offers, newest first."""
+    cursor = (
+        db.hub_offers.find({"seller": actor_id}, OFFER_CARD_PROJECTION)
+        .sort("published", -1)
+        .limit(100)
+        .batch_size(100)
+    )
+    try:
+        return await cursor.clone().hint([("seller", 1), ("published", -1)]).to_list(length=100)
+    except OperationFailure:
+        # Hinted index not built yet (or its build failed); let the planner choose
+        return await cursor.to_list(length=100)
+
+
+@router.get("/offers/source")
+async def offer_source(offer_id: str) -> dict:
+    """Return the original activity an offer was indexed from."""
+    activity = await get_offer_source(offer_id)
+    if activity is None:
+        raise HTTPException(status_code=404, detail="Offer not found")
+    return activity
+
+
+@stale_while_revalidate(namespace="offers", fresh=10, expire=600)
+async def _latest_feed(limit: int) -> dict:
+    """Build the latest offers feed.
+
+    Served from cache; entries older than 10s are refreshed in the background
+    while the previous feed is returned, so pollers never wait on MongoDB.
+    """
+    cursor = db.hub_offers.find({}, OFFER_CARD_PROJECTION).sort("published", -1).limit(limit).batch_size(limit)
     items = await cursor.to_list(length=limit)
     return {"items": items, "limit": limit}
 
 
-@router.get("/tags")
-async def tags_top(limit: int = 50) -> dict:
-    """Return top tags with counts computed via aggregation pipeline."""
-    check_enabled()
+@router.get("/feeds/latest")
+async def feeds_latest(request: Request, limit: int = 20) -> Response:
+    """Return the latest offers feed (ETag-aware)."""
+    return conditional_response(request, orjson.dumps(await _latest_feed(limit), default=str))
+
+
+# Both /tags and /categories are views over the same tag histogram; computing
+# at least this many entries lets them share one cached aggregation.
+_TOP_TAGS_MIN = 50
+
+
+@cached(namespace="offers", expire=60)
+async def _top_tags(limit: int) -> list[dict]:
+    """Return the top tags as [{_id, count}] computed via aggregation pipeline."""
     pipeline = [
+        # Only offers still on sale; filtering before $unwind shrinks the input
+        {"$match": {"sold": {"$ne": True}}},
         {"$unwind": "$tags"},
         {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
         {"$sort": {"count": -1}},
         {"$limit": limit},
     ]
-    tags = await db.hub_offers.aggregate(pipeline).to_list(length=limit)
+    return await db.hub_offers.aggregate(pipeline).to_list(length=limit)
+
+
+@router.get("/tags")
+async def tags_top(request: Request, limit: int = 50) -> Response:
+    """Return top tags with counts computed via aggregation pipeline (ETag-aware)."""
+    tags = (await _top_tags(max(limit, _TOP_TAGS_MIN)))[:limit]
     # Приводим к простому виду
-    return {"tags": [{"tag": t["_id"], "count": t["count"]} for t in tags]}
+    body = {"tags": [{"tag": t["_id"], "count": t["count"]} for t in tags]}
+    return conditional_response(request, orjson.dumps(body))
 
 
 @router.get("/categories")
-async def categories() -> dict:
-    """Return a simplified list of categories based on top tags."""
-    check_enabled()
+async def categories(request: Request) -> Response:
+    """Return a simplified list of categories based on top tags (ETag-aware)."""
     # Упрощение: категории как верхние теги
-    pipeline = [
-        {"$unwind": "$tags"},
-        {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 20},
-    ]
-    cats = await db.hub_offers.aggregate(pipeline).to_list(length=20)
-    return {"categories": [c["_id"] for c in cats]}
+    cats = (await _top_tags(_TOP_TAGS_MIN))[:20]
+    return conditional_response(request, orjson.dumps({"categories": [c["_id"] for c in cats]}))
 
 
 @router.post("/replicate")
 async def replicate(activity: dict) -> dict:
-    """Приём репликации между хабами — делаем то же, что и в inbox"""
-    return await hub_inbox(activity)
+    """Приём репликации между хабами — индексируем так же, как inbox"""
+    await _dispatch(activity)
+    return {"status": "indexed"}
 
 
 @router.get("/info")
-async def info() -> dict:
-    """Return basic information and counters for the hub."""
-    check_enabled()
+@cached(namespace="offers", expire=60)
+async def info(exact: bool = False) -> dict:
+    """Return basic information and counters for the hub.
+
+    Counters come from collection metadata (O(1), approximate) unless exact=1
+    is requested, which falls back to full count_documents scans.
+    """
+    # Both counters are independent, so fetch them in a single round-trip window
+    if exact:
+        offers, trust_links = await asyncio.gather(
+            db.hub_offers.count_documents({}),
+            db.hub_trust_log.count_documents({}),
+        )
+    else:
+        offers, trust_links = await asyncio.gather(
+            db.hub_offers.estimated_document_count(),
+            db.hub_trust_log.estimated_document_count(),
+        )
     return {
         "name": config.HUB_NAME,
         "domain": config.HUB_DOMAIN,
         "mode": "hub",
-        "offers": await db.hub_offers.count_documents({}),
-        "trust_links": await db.hub_trust_log.count_documents({}),
+        "offers": offers,
+        "trust_links": trust_links,
     }
 
 
@@ -164,8 +259,6 @@ async def create_escrow(payload: Dict[str, Any]) -> Dict[str, Any]:
       - amount_ton: float — сумма в TON (как в оффере)
       - timeout_days: int (опц.) — окно для эскроу, по умолчанию 7
     """
-    check_enabled()
-
     product_id = payload.get("product_id")
     buyer_address = payload.get("buyer_address")
     amount_ton = payload.get("amount_ton")
@@ -182,11 +275,29 @@ async def create_escrow(payload: Dict[str, Any]) -> Dict[str, Any]:
     if amount_ton_num <= 0:
         raise HTTPException(status_code=400, detail="amount_ton must be positive")
 
-    # Проверим наличие товара и не зарезервирован ли он уже
-    product = await db.hub_offers.find_one({"id": product_id})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    if product.get("reserved"):
+    # Время фиксируем один раз на запрос
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    reserved_until_iso = (now + timedelta(days=timeout_days)).isoformat()
+
+    # Атомарно резервируем товар: проверка и установка брони — одна операция,
+    # поэтому два покупателя не могут зарезервировать один и тот же товар
+    product = await db.hub_offers.find_one_and_update(
+        {"id": product_id, "reserved": {"$ne": True}},
+        {
+            "$set": {
+                "reserved": True,
+                "reserved_by": buyer_address,
+                "reserved_until": reserved_until_iso,
+            }
+        },
+        projection={"_id": 0, "seller": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if product is None:
+        # Различаем «нет товара» и «уже в резерве» дешёвым запросом по id
+        if await db.hub_offers.find_one({"id": product_id}, {"_id": 1}) is None:
+            raise HTTPException(status_code=404, detail="Product not found")
         raise HTTPException(status_code=409, detail="Product already reserved")
 
     # Создаём эскроу (симуляция в сервисе)
@@ -196,11 +307,15 @@ async def create_escrow(payload: Dict[str, Any]) -> Dict[str, Any]:
             amount_ton=amount_ton_num,
             timeout_days=timeout_days,
         )
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-    now = datetime.now(timezone.utc)
-    reserved_until = now + timedelta(days=timeout_days)
+    except Exception as e:
+        # Сделка не создана — снимаем только что поставленную бронь
+        await db.hub_offers.update_one(
+            {"id": product_id, "reserved_by": buyer_address, "reserved_deal_id": {"$exists": False}},
+            {"$set": {"reserved": False}, "$unset": {"reserved_by": "", "reserved_until": ""}},
+        )
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
 
     # Запишем сделку в коллекцию hub_deals
     deal_doc = {
@@ -212,23 +327,16 @@ async def create_escrow(payload: Dict[str, Any]) -> Dict[str, Any]:
         "amount_ton": amount_ton_num,
         "amount_nano": deal["amount_nano"],
         "timeout_days": timeout_days,
-        "reserved_at": now.isoformat(),
-        "reserved_until": reserved_until.isoformat(),
+        "reserved_at": now_iso,
+        "reserved_until": reserved_until_iso,
         "contract_address": deal.get("contract_address"),
     }
-    await db.hub_deals.update_one({"deal_id": deal_doc["deal_id"]}, {"$set": deal_doc}, upsert=True)
-
-    # Обновим товар: пометим как зарезервированный
-    await db.hub_offers.update_one(
-        {"id": product_id},
-        {
-            "$set": {
-                "reserved": True,
-                "reserved_deal_id": deal_doc["deal_id"],
-                "reserved_by": buyer_address,
-                "reserved_until": reserved_until.isoformat(),
-            }
-        },
+    # Запись сделки и привязка брони к ней независимы — выполняем одновременно.
+    # Уникальность deal_id гарантирует индекс, поэтому достаточно insert_one
+    # (копия — чтобы insert_one не добавил _id в ответ)
+    await asyncio.gather(
+        db.hub_deals.insert_one(dict(deal_doc)),
+        db.hub_offers.update_one({"id": product_id}, {"$set": {"reserved_deal_id": deal_doc["deal_id"]}}),
     )
 
     return {"status": "frozen", "deal": deal_doc}
@@ -237,9 +345,7 @@ async def create_escrow(payload: Dict[str, Any]) -> Dict[str, Any]:
 @router.post("/payments/{deal_id}/confirm")
 async def confirm_payment(deal_id: str) -> Dict[str, Any]:
     """Подтвердить доставку — освободить средства продавцу и завершить сделку."""
-    check_enabled()
-
-    deal = await db.hub_deals.find_one({"deal_id": deal_id})
+    deal = await db.hub_deals.find_one({"deal_id": deal_id}, _DEAL_STATE_PROJECTION)
     if not deal:
         raise HTTPException(status_code=404, detail="Deal not found")
     if deal.get("status") != "frozen":
@@ -248,39 +354,40 @@ async def confirm_payment(deal_id: str) -> Dict[str, Any]:
     # Симуляция вызова смарт-контракта
     result = await confirm_delivery(deal_id)
 
-    now = datetime.now(timezone.utc).isoformat()
-    await db.hub_deals.update_one(
-        {"deal_id": deal_id},
-        {"$set": {"status": "released", "released_at": now, "release_tx": result}},
-    )
-
-    # Обновим карточку товара: снятие резерва, отметка о продаже
-    await db.hub_offers.update_one(
-        {"id": deal["product_id"]},
-        {
-            "$set": {
-                "reserved": False,
-                "sold": True,
-                "sold_deal_id": deal_id,
-            },
-            "$unset": {
-                "reserved_deal_id": "",
-                "reserved_by": "",
-                "reserved_until": "",
+    now_iso = datetime.now(timezone.utc).isoformat()
+    # Сделка и карточка товара обновляются одновременно; обновлённая сделка
+    # возвращается сразу, без повторного чтения
+    updated, _ = await asyncio.gather(
+        db.hub_deals.find_one_and_update(
+            {"deal_id": deal_id},
+            {"$set": {"status": "released", "released_at": now_iso, "release_tx": result}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        ),
+        # Обновим карточку товара: снятие резерва, отметка о продаже
+        db.hub_offers.update_one(
+            {"id": deal["product_id"]},
+            {
+                "$set": {
+                    "reserved": False,
+                    "sold": True,
+                    "sold_deal_id": deal_id,
+                },
+                "$unset": {
+                    "reserved_deal_id": "",
+                    "reserved_by": "",
+                    "reserved_until": "",
+                },
             },
-        },
+        ),
     )
-
-    updated = await db.hub_deals.find_one({"deal_id": deal_id})
     return {"status": "released", "deal": updated}
 
 
 @router.post("/payments/{deal_id}/refund")
 async def refund_payment(deal_id: str) -> Dict[str, Any]:
     """Запросить возврат средств — снимаем бронь с товара."""
-    check_enabled()
-
-    deal = await db.hub_deals.find_one({"deal_id": deal_id})
+    deal = await db.hub_deals.find_one({"deal_id": deal_id}, _DEAL_STATE_PROJECTION)
     if not deal:
         raise HTTPException(status_code=404, detail="Deal not found")
     if deal.get("status") != "frozen":
@@ -288,30 +395,31 @@ async def refund_payment(deal_id: str) -> Dict[str, Any]:
 
     result = await request_refund(deal_id)
 
-    now = datetime.now(timezone.utc).isoformat()
-    await db.hub_deals.update_one(
-        {"deal_id": deal_id},
-        {"$set": {"status": "refund_requested", "refund_at": now, "refund_tx": result}},
-    )
-
-    # Снимем бронь с товара
-    await db.hub_offers.update_one(
-        {"id": deal["product_id"]},
-        {
-            "$set": {"reserved": False},
-            "$unset": {"reserved_deal_id": "", "reserved_by": "", "reserved_until": ""},
-        },
+    now_iso = datetime.now(timezone.utc).isoformat()
+    updated, _ = await asyncio.gather(
+        db.hub_deals.find_one_and_update(
+            {"deal_id": deal_id},
+            {"$set": {"status": "refund_requested", "refund_at": now_iso, "refund_tx": result}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        ),
+        # Снимем бронь с товара
+        db.hub_offers.update_one(
+            {"id": deal["product_id"]},
+            {
+                "$set": {"reserved": False},
+                "$unset": {"reserved_deal_id": "", "reserved_by": "", "reserved_until": ""},
+            },
+        ),
     )
-
-    updated = await db.hub_deals.find_one({"deal_id": deal_id})
     return {"status": "refund_requested", "deal": updated}
 
 
 @router.get("/payments/{deal_id}")
 async def get_deal(deal_id: str) -> Dict[str, Any]:
     """Получить текущее состояние сделки (эскроу)."""
-    check_enabled()
-    deal = await db.hub_deals.find_one({"deal_id": deal_id})
+    # _id (ObjectId) не сериализуется в JSON — исключаем его проекцией
+    deal = await db.hub_deals.find_one({"deal_id": deal_id}, {"_id": 0})
     if not deal:
         raise HTTPException(status_code=404, detail="Deal not found")
     return deal
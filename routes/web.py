@@ -1,17 +1,68 @@
 """Web UI routes for HTML rendering.
 
 These endpoints render minimal search pages using Jinja2. They proxy to the
-service layer for search results and feed them to a shared template.
+service layer for search results and feed them to a shared template; rendered
+pages are cached briefly per query.
 """
+from pathlib import Path
+
 from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse, PlainTextResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response
 from fastapi.templating import Jinja2Templates
 
 import config
+from routes.etag import conditional_response
+from services.cache_service import cached
 from services.hub_service import search_products
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+# Resolved from this file, not the working directory, since the search
+# template is loaded at import
+templates = Jinja2Templates(directory=Path(__file__).resolve().parent.parent / "templates")
+# Templates do not change at runtime: skip per-render mtime checks and resolve
+# the search template once instead of looking it up on every request.
+templates.env.auto_reload = False
+_search_tpl = templates.env.get_template("search.html")
+
+
+@cached(namespace="offers", expire=30)
+async def _search_html(
+    q: str | None,
+    tag: str,
+    min_price: float | None,
+    max_price: float | None,
+    limit: int,
+    substring: bool = False,
+) -> str:
+    """Run the search and render the shared results page to HTML.
+
+    Keyed only by the query parameters: the page carries no per-user data, so
+    identical searches can be served from the rendered-HTML cache.
+    """
+    results = await search_products(q, tag, min_price, max_price, limit, substring)
+    return _search_tpl.render(
+        {
+            "name": config.HUB_NAME,
+            "q": q or "",
+            "tag": tag or "",
+            "substring": substring,
+            "results": results or [],
+        }
+    )
+
+
+async def _render_search(
+    request: Request,
+    q: str | None,
+    tag: str,
+    min_price: float | None,
+    max_price: float | None,
+    limit: int,
+    substring: bool,
+) -> Response:
+    """Build the (ETag-aware) HTML response shared by all search page routes."""
+    html = await _search_html(q, tag, min_price, max_price, limit, substring)
+    return conditional_response(request, html.encode("utf-8"), media_type="text/html; charset=utf-8")
 
 
 @router.get("/", response_class=HTMLResponse)
@@ -22,19 +73,10 @@ async def index(
     min_price: float | None = None,
     max_price: float | None = None,
     limit: int = 20,
+    substring: bool = False,
 ):
     """Render the main search page with optional filters."""
-    results = await search_products(q, tag, min_price, max_price, limit)
-    return templates.TemplateResponse(
-        "search.html",
-        {
-            "request": request,
-            "name": config.HUB_NAME,
-            "q": q or "",
-            "tag": tag or "",
-            "results": results or [],
-        },
-    )
+    return await _render_search(request, q, tag, min_price, max_price, limit, substring)
 
 
 @router.get("/search", response_class=HTMLResponse)
@@ -45,19 +87,10 @@ async def search_page(
     min_price: float | None = None,
     max_price: float | None = None,
     limit: int = 20,
+    substring: bool = False,
 ):
     """Alternative path to render the same search UI."""
-    results = await search_products(q, tag, min_price, max_price, limit)
-    return templates.TemplateResponse(
-        "search.html",
-        {
-            "request": request,
-            "name": config.HUB_NAME,
-            "q": q or "",
-            "tag": tag or "",
-            "results": results or [],
-        },
-    )
+    return await _render_search(request, q, tag, min_price, max_price, limit, substring)
 
 
 # Map hub UI paths to the same search interface for convenience
@@ -69,19 +102,10 @@ async def hub_home(
     min_price: float | None = None,
     max_price: float | None = None,
     limit: int = 20,
+    substring: bool = False,
 ):
     """Hub landing page rendering the shared search template."""
-    results = await search_products(q, tag, min_price, max_price, limit)
-    return templates.TemplateResponse(
-        "search.html",
-        {
-            "request": request,
-            "name": config.HUB_NAME,
-            "q": q or "",
-            "tag": tag or "",
-            "results": results or [],
-        },
-    )
+    return await _render_search(request, q, tag, min_price, max_price, limit, substring)
 
 
 @router.get("/hub/search", response_class=HTMLResponse)
@@ -92,19 +116,10 @@ async def hub_search(
     min_price: float | None = None,
     max_price: float | None = None,
     limit: int = 20,
+    substring: bool = False,
 ):
     """Hub search path rendering the shared search template."""
-    results = await search_products(q, tag, min_price, max_price, limit)
-    return templates.TemplateResponse(
-        "search.html",
-        {
-            "request": request,
-            "name": config.HUB_NAME,
-            "q": q or "",
-            "tag": tag or "",
-            "results": results or [],
-        },
-    )
+    return await _render_search(request, q, tag, min_price, max_price, limit, substring)
 
 
 @router.get("/hub/product/{id}", response_class=PlainTextResponse)
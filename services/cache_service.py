@@ -0,0 +1,176 @@
+"""Response cache with an optional Redis backend and in-process fallback.
+
+Slow-changing hub endpoints (tag stats, feeds, counters) are cached for a short
+TTL so repeated requests do not hit MongoDB. When REDIS_URL is configured and
+the redis package is installed, entries are shared between workers via Redis;
+otherwise a per-process dictionary is used. Values are stored as JSON bytes so
+both backends return fresh, independent copies on every hit.
+
+Entries are grouped by namespace, which allows writers to invalidate all views
+derived from a collection at once (e.g. ``clear("offers")`` in index_offer).
+
+Two decorators are provided: ``cached`` (plain TTL) and
+``stale_while_revalidate``, which keeps serving the last value while a single
+background task refreshes it, and keeps serving it if the refresh fails.
+"""
+import asyncio
+import functools
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import orjson
+
+from config import REDIS_URL
+
+# Safe import: redis can be missing in the environment
+try:
+    from redis import asyncio as _redis_asyncio  # type: ignore
+except Exception:  # noqa: BLE001 - keep the app functional without redis
+    _redis_asyncio = None
+
+_PREFIX = "ozodon"
+
+_redis = _redis_asyncio.from_url(REDIS_URL) if (_redis_asyncio is not None and REDIS_URL) else None
+
+# In-process fallback: key -> (expires_at monotonic, JSON bytes), bounded so
+# that many distinct parameter combinations cannot grow it without limit
+_local: Dict[str, Tuple[float, bytes]] = {}
+_LOCAL_MAX_ENTRIES = 4096
+
+# Background refreshes in flight, by key; also keeps task references alive
+_refreshing: Dict[str, "asyncio.Task[None]"] = {}
+
+T = TypeVar("T")
+
+
+def _key(namespace: str, name: str, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
+    """Build a cache key from the namespace, function name and call arguments."""
+    params = ",".join([repr(a) for a in args] + [f"{k}={kwargs[k]!r}" for k in sorted(kwargs)])
+    return f"{_PREFIX}:{namespace}:{name}:{params}"
+
+
+async def get(key: str) -> Optional[Any]:
+    """Return the cached value for key, or None on a miss or backend error."""
+    if _redis is not None:
+        try:
+            raw = await _redis.get(key)
+        except Exception:  # noqa: BLE001 - a cache outage must not fail requests
+            return None
+        return orjson.loads(raw) if raw is not None else None
+    entry = _local.get(key)
+    if entry is None:
+        return None
+    if entry[0] < time.monotonic():
+        _local.pop(key, None)
+        return None
+    return orjson.loads(entry[1])
+
+
+async def put(key: str, value: Any, expire: int) -> None:
+    """Store value under key for expire seconds; backend errors are ignored."""
+    # default=str covers Mongo ObjectId and datetime values
+    raw = orjson.dumps(value, default=str)
+    if _redis is not None:
+        try:
+            await _redis.set(key, raw, ex=expire)
+        except Exception:  # noqa: BLE001 - a cache outage must not fail requests
+            pass
+        return
+    now = time.monotonic()
+    if len(_local) >= _LOCAL_MAX_ENTRIES:
+        for k in [k for k, (exp, _) in _local.items() if exp < now]:
+            del _local[k]
+        if len(_local) >= _LOCAL_MAX_ENTRIES:
+            # Still full: evict the oldest insertion
+            del _local[next(iter(_local))]
+    _local[key] = (now + expire, raw)
+
+
+async def clear(namespace: str) -> None:
+    """Drop every entry stored under namespace."""
+    prefix = f"{_PREFIX}:{namespace}:"
+    if _redis is not None:
+        try:
+            keys = [k async for k in _redis.scan_iter(match=f"{prefix}*")]
+            if keys:
+                await _redis.delete(*keys)
+        except Exception:  # noqa: BLE001 - stale entries expire via TTL anyway
+            pass
+        return
+    for key in [k for k in _local if k.startswith(prefix)]:
+        _local.pop(key, None)
+
+
+async def close() -> None:
+    """Close the Redis connection pool, if one was created."""
+    if _redis is not None:
+        await _redis.aclose()
+
+
+def cached(namespace: str, expire: int) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Cache an async function's result per call arguments for expire seconds.
+
+    Intended for FastAPI handlers, which are always invoked with keyword
+    arguments; the wrapped signature is preserved for dependency injection.
+    """
+
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            key = _key(namespace, func.__qualname__, args, kwargs)
+            hit = await get(key)
+            if hit is not None:
+                return hit
+            result = await func(*args, **kwargs)
+            await put(key, result, expire)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+async def _refresh(
+    key: str,
+    func: Callable[..., Awaitable[Any]],
+    args: Tuple[Any, ...],
+    kwargs: Dict[str, Any],
+    expire: int,
+) -> None:
+    """Recompute a stale-while-revalidate entry; keep the old one on failure."""
+    try:
+        value = await func(*args, **kwargs)
+        await put(key, {"t": time.time(), "v": value}, expire)
+    except Exception:  # noqa: BLE001 - the stale entry keeps being served
+        pass
+    finally:
+        _refreshing.pop(key, None)
+
+
+def stale_while_revalidate(
+    namespace: str, fresh: int, expire: int
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Cache an async function's result with stale-while-revalidate semantics.
+
+    Entries younger than fresh seconds are returned as-is. Older entries are
+    still returned immediately while one background task per key recomputes
+    them; if that recomputation fails the stale value stays in place until it
+    expires after expire seconds. Only a missing entry is computed inline.
+    """
+
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            key = _key(namespace, func.__qualname__, args, kwargs)
+            entry = await get(key)
+            if entry is not None:
+                if time.time() - entry["t"] >= fresh and key not in _refreshing:
+                    _refreshing[key] = asyncio.create_task(_refresh(key, func, args, kwargs, expire))
+                return entry["v"]
+            result = await func(*args, **kwargs)
+            await put(key, {"t": time.time(), "v": result}, expire)
+            return result
+
+        return wrapper
+
+    return decorator
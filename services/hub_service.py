@@ -10,14 +10,29 @@ This module implements the core logic for:
 The implementation tries to avoid hard failures and prefers safe fallbacks to
 keep the hub operating even when optional components are unavailable.
 """
-import json
-from typing import Any, Dict, List
+import asyncio
+import logging
+import os
+import re
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Set, Tuple
 
 import httpx
+import orjson
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, WriteError
 
 import config
+from activitypub import (
+    SCHEMA_DESCRIPTION,
+    SCHEMA_IMAGE,
+    SCHEMA_NAME,
+    SCHEMA_OFFERS,
+    SCHEMA_PRICE,
+    SCHEMA_PRICE_CURRENCY,
+)
 from config import HUBS_FILE
 from database import db
+from services import cache_service
 
 try:
     # Optional import: trust service may be absent in some deployments
@@ -25,73 +40,422 @@ try:
 except Exception:  # noqa: BLE001 - intentionally broad to keep service running
     _compute_trust_path = None
 
+try:
+    # Optional import: HTTP/2 for replication needs the h2 package (httpx[http2])
+    import h2  # noqa: F401
+    _HTTP2 = True
+except Exception:  # noqa: BLE001 - fall back to HTTP/1.1 keep-alive
+    _HTTP2 = False
+
+log = logging.getLogger("ozodon.hub")
+
+
+# Fields needed to render an offer in feeds and listings. Skipping the derived
+# search fields and Mongo _id keeps payloads small and JSON-serializable.
+OFFER_CARD_PROJECTION: Dict[str, int] = {
+    "_id": 0,
+    "id": 1,
+    "name": 1,
+    "price": 1,
+    "currency": 1,
+    "image": 1,
+    "seller": 1,
+    "tags": 1,
+    "published": 1,
+}
+
+
+# Parsed registry together with the file mtime (ns) it was read at
+_hubs_cache: Tuple[int, List[Dict[str, Any]]] | None = None
+
 
 def load_hubs() -> List[Dict[str, Any]]:
     """Load the registry of hubs from a JSON file.
 
+    The parsed list is reused until the file's modification time changes, so
+    replication does not re-read and re-parse it per activity. Callers must
+    treat the result as read-only.
+
     Returns:
         A list of hub descriptors. Each hub may contain fields like domain and
         active. The format is controlled by hubs.json.
     """
-    with open(HUBS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    global _hubs_cache
+    mtime = os.stat(HUBS_FILE).st_mtime_ns
+    if _hubs_cache is not None and _hubs_cache[0] == mtime:
+        return _hubs_cache[1]
+    with open(HUBS_FILE, "rb") as f:
+        hubs = orjson.loads(f.read())
+    _hubs_cache = (mtime, hubs)
+    return hubs
 
 
-async def index_offer(activity: dict) -> Dict[str, Any]:
-    """Index an Offer activity into the hub_offers collection.
+class _WriteBatcher:
+    """Coalesce concurrent index calls into one bulk write.
+
+    An item submitted while no flush is running is written right away. Items
+    submitted during a flush are queued and handed to the next flush together,
+    which starts as soon as the running one finishes (or once max_size items
+    are queued). Every caller awaits its own result, so a request still
+    completes only after its write is acknowledged.
+
+    Each item is normalized by prepare inside submit(), so a malformed item
+    fails only its own caller and never reaches the batch. flush returns one
+    result per item; an exception in that list is raised to that item's caller
+    only.
+    """
+
+    def __init__(
+        self,
+        prepare: Callable[[dict], Any],
+        flush: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_size: int = 500,
+    ):
+        self._prepare = prepare
+        self._flush = flush
+        self._max_size = max_size
+        self._pending: List[Tuple[Any, "asyncio.Future[Any]"]] = []
+        # Running flushes; also keeps references so they are not garbage collected
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+    def submit(self, item: dict) -> "asyncio.Future[Any]":
+        """Prepare item, queue it for the next flush and return its result future.
+
+        Preparation errors are raised right here, before anything is queued.
+        Must be called from a running event loop.
+        """
+        prepared = self._prepare(item)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((prepared, future))
+        if not self._tasks or len(self._pending) >= self._max_size:
+            self._start_flush()
+        return future
+
+    def _start_flush(self) -> None:
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: "asyncio.Task[None]") -> None:
+        self._tasks.discard(task)
+        # Items queued while the last flush ran go out together right away
+        if not self._tasks:
+            self._start_flush()
 
-    Extracts and normalizes the product fields required for search and display.
-    Uses upsert to keep the index idempotent when re-processing the same offer.
+    async def _run(self, batch: List[Tuple[Any, "asyncio.Future[Any]"]]) -> None:
+        try:
+            results = await self._flush([item for item, _ in batch])
+        except Exception as e:  # noqa: BLE001 - nothing was written; every caller fails
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+async def _bulk_write(collection: Any, ops: List[Any]) -> Dict[int, Exception]:
+    """Run an unordered bulk write and return the errors of failed ops by position.
+
+    Errors not tied to a single op (e.g. write concern) are raised as-is.
     """
-    obj = activity.get("object", {})
-    offers_data = obj.get("schema:offers", {})
-    product = {
+    try:
+        await collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors") or []
+        if not write_errors or e.details.get("writeConcernErrors"):
+            raise
+        return {err["index"]: WriteError(err.get("errmsg"), err.get("code"), err) for err in write_errors}
+    return {}
+
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _phrase(text: str) -> str:
+    """Normalize text to lowercase words separated by single spaces."""
+    return " ".join(_TOKEN_RE.findall(text.lower()))
+
+
+def _phraselist(*texts: str) -> List[str]:
+    """Return the distinct lowercase words of the given texts.
+
+    Stored in a multikey-indexed array, it answers the word-prefix lookups of
+    short substring queries with an index probe. Longer queries go through
+    trigrams, so multi-word phrases are not stored.
+    """
+    return sorted({token for text in texts for token in _TOKEN_RE.findall(text.lower())})
+
+
+def _trigrams(text: str) -> Set[str]:
+    """Return the set of 3-character substrings of text."""
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+# Trigrams of a query used to pre-filter candidates; $all probes the index
+# with the first one and checks the rest on the fetched documents.
+_QUERY_TRIGRAMS_MAX = 4
+
+
+def _query_trigrams(text: str) -> List[str]:
+    """Pick up to 4 non-overlapping trigrams of a lowercased query.
+
+    Non-overlapping trigrams span as much of the query as possible, and
+    trigrams with digits or symbols come first, as they are usually rarer
+    than letter-only ones and narrow the index probe the most.
+    """
+    grams = list(dict.fromkeys(text[i : i + 3] for i in range(0, len(text) - 2, 3)))
+    if len(text) % 3:
+        # Cover the tail the stride skipped
+        grams.append(text[-3:])
+    grams.sort(key=lambda g: g.isalpha())
+    return grams[:_QUERY_TRIGRAMS_MAX]
+
+
+def _search_fields(name: str, description: str) -> Dict[str, Any]:
+    """Derive the normalized fields that back index-served search."""
+    return {
+        # Lowercased once at write time so prefix lookups need no case folding
+        "name_lower": name.lower(),
+        "description_lower": description.lower(),
+        "phraselist": _phraselist(name, description),
+        "trigrams": sorted(_trigrams(name.lower()) | _trigrams(description.lower())),
+        "search_fields_version": _SEARCH_FIELDS_VERSION,
+    }
+
+
+# Ranking of offers indexed before reputation_score/rank_score were stored:
+# a neutral 0.5 reputation, under which rank_score equals the price.
+_DEFAULT_REPUTATION: Dict[str, Any] = {"$ifNull": ["$reputation_score", 0.5]}
+_DEFAULT_RANK: Dict[str, Any] = {"$ifNull": ["$rank_score", "$price"]}
+
+# Fields used to rank and render search results. Internal fields (Mongo _id,
+# derived search fields, any legacy embedded source activity) stay in Mongo.
+_SEARCH_RESULT_PROJECTION: Dict[str, Any] = {
+    "_id": 0,
+    "id": 1,
+    "name": 1,
+    "description": 1,
+    "image": 1,
+    "price": 1,
+    "currency": 1,
+    "seller": 1,
+    "tags": 1,
+    "published": 1,
+    "reputation_score": _DEFAULT_REPUTATION,
+    "rank_score": _DEFAULT_RANK,
+}
+
+# Version of the derived search fields; offers stored with another version
+# (or none) are re-derived by backfill_search_fields. Bump when _search_fields
+# changes.
+_SEARCH_FIELDS_VERSION = 2
+
+
+async def backfill_search_fields() -> None:
+    """Store current derived search fields on offers indexed with older ones."""
+    ops: List[UpdateOne] = []
+    cursor = db.hub_offers.find(
+        {"search_fields_version": {"$ne": _SEARCH_FIELDS_VERSION}}, {"_id": 1, "name": 1, "description": 1}
+    )
+    async for doc in cursor:
+        fields = _search_fields(doc.get("name") or "", doc.get("description") or "")
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if len(ops) >= 500:
+            await db.hub_offers.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.hub_offers.bulk_write(ops, ordered=False)
+
+
+async def migrate_offer_sources() -> None:
+    """Move source activities still embedded in hub_offers to hub_offers_source.
+
+    Offers indexed before the split carry their activity as source_activity;
+    it is copied to hub_offers_source (keeping a newer copy if one exists) and
+    then removed from the offer.
+    """
+    source_ops: List[UpdateOne] = []
+    offer_ops: List[UpdateOne] = []
+    cursor = db.hub_offers.find({"source_activity": {"$exists": True}}, {"_id": 1, "id": 1, "source_activity": 1})
+    async for doc in cursor:
+        source_ops.append(
+            UpdateOne({"id": doc["id"]}, {"$setOnInsert": {"activity": doc["source_activity"]}}, upsert=True)
+        )
+        offer_ops.append(UpdateOne({"_id": doc["_id"]}, {"$unset": {"source_activity": ""}}))
+        if len(offer_ops) >= 500:
+            # Copy before unsetting, so an interrupted run loses nothing
+            await db.hub_offers_source.bulk_write(source_ops, ordered=False)
+            await db.hub_offers.bulk_write(offer_ops, ordered=False)
+            source_ops, offer_ops = [], []
+    if offer_ops:
+        await db.hub_offers_source.bulk_write(source_ops, ordered=False)
+        await db.hub_offers.bulk_write(offer_ops, ordered=False)
+
+
+def _offer_doc(activity: dict) -> Dict[str, Any]:
+    """Extract and normalize the product fields required for search and display."""
+    obj = activity.get("object") or {}
+    offers_data = obj.get(SCHEMA_OFFERS) or {}
+    actor = activity["actor"]
+    name = obj.get(SCHEMA_NAME) or ""
+    description = obj.get(SCHEMA_DESCRIPTION) or ""
+    return {
         "id": obj.get("id") or activity.get("id"),
-        "name": obj.get("schema:name", ""),
-        "description": obj.get("schema:description", ""),
-        "image": obj.get("schema:image"),
-        "price": float(offers_data.get("schema:price", 0)),
-        "currency": offers_data.get("schema:priceCurrency", "TON"),
-        "seller": activity["actor"],
-        # Derive origin instance from actor URL (scheme://host/..)
-        "origin_instance": activity["actor"].split("/")[2],
+        "name": name,
+        "description": description,
+        "image": obj.get(SCHEMA_IMAGE),
+        "price": float(offers_data.get(SCHEMA_PRICE, 0)),
+        "currency": offers_data.get(SCHEMA_PRICE_CURRENCY, "TON"),
+        "seller": actor,
+        # Derive origin instance from actor URL (scheme://host/..); only the
+        # first three separators matter, so stop splitting after them
+        "origin_instance": actor.split("/", 3)[2],
         "tags": [t["name"].lstrip("#") for t in activity.get("tag", [])],
         "published": activity.get("published"),
-        # Keep original activity for traceability/debugging
-        "source_activity": activity,
+        **_search_fields(name, description),
     }
-    await db.hub_offers.update_one({"id": product["id"]}, {"$set": product}, upsert=True)
-    return product
 
 
-async def index_trust(activity: dict) -> Dict[str, Any] | None:
-    """Index a fedmarket:Trust activity into the hub_trust_log collection.
+async def _write_offers(items: List[Tuple[Dict[str, Any], dict]]) -> List[Any]:
+    """Upsert normalized offers and store their source activities.
+
+    Upserts by offer id keep the index idempotent when re-processing the same
+    offer; unordered execution lets one bad document not block the rest. The
+    original activities are kept for traceability/debugging in
+    hub_offers_source, so that hub_offers documents stay small.
+
+    Args:
+        items: (product, original activity) pairs, as built by _offer_doc.
 
     Returns:
-        The normalized trust document, or None if activity type is not Trust.
+        Per item, the stored product or the error its writes failed with.
     """
-    if activity.get("type") != "fedmarket:Trust":
-        return None
+    products = [product for product, _ in items]
+    # Ranking fields are stored with the offer so search can sort in Mongo
+    reputation = await _reputations({p["seller"] for p in products})
+    for p in products:
+        p["reputation_score"] = reputation[p["seller"]]
+        p["rank_score"] = _rank_score(p["price"], p["reputation_score"])
+    ops = [
+        # $unset drops the embedded copy older documents still carry
+        UpdateOne({"id": p["id"]}, {"$set": p, "$unset": {"source_activity": ""}}, upsert=True)
+        for p in products
+    ]
+    source_ops = [UpdateOne({"id": p["id"]}, {"$set": {"activity": a}}, upsert=True) for p, a in items]
+    offer_errors, source_errors = await asyncio.gather(
+        _bulk_write(db.hub_offers, ops),
+        _bulk_write(db.hub_offers_source, source_ops),
+    )
+    # Feeds and tag stats are derived from hub_offers
+    await cache_service.clear("offers")
+    return [offer_errors.get(i) or source_errors.get(i) or p for i, p in enumerate(products)]
+
+
+def _trust_doc(activity: dict) -> Dict[str, Any]:
+    """Normalize a fedmarket:Trust activity into a hub_trust_log document."""
     obj = activity["object"]
-    trust = {
+    return {
         "source": activity["actor"],
         "target": obj["target"],
         "weight": obj["weight"],
         "timestamp": obj.get("issued") or activity.get("published"),
     }
-    await db.hub_trust_log.update_one(
-        {"source": trust["source"], "target": trust["target"]},
-        {"$set": trust},
-        upsert=True,
-    )
-    return trust
 
 
+async def _write_trusts(trusts: List[Dict[str, Any]]) -> List[Any]:
+    """Upsert normalized trust links and refresh the scores they affect.
+
+    The precomputed hub_trust_scores of every touched target are recomputed
+    from the log in a single aggregation.
+
+    Returns:
+        Per link, the stored document or the error its write failed with.
+    """
+    ops = [
+        UpdateOne({"source": t["source"], "target": t["target"]}, {"$set": t}, upsert=True)
+        for t in trusts
+    ]
+    errors = await _bulk_write(db.hub_trust_log, ops)
+    targets = list({t["target"] for i, t in enumerate(trusts) if i not in errors})
+    if targets:
+        await rebuild_trust_scores(targets)
+        # Cached reputation scores depend on hub_trust_log
+        await cache_service.clear("trust")
+        # Targets may be sellers: refresh the ranking stored on their offers
+        await refresh_reputation_scores(targets)
+    return [errors.get(i) or t for i, t in enumerate(trusts)]
+
+
+# Inbox and replication deliver activities one by one; concurrent deliveries
+# arriving while a write is in flight are flushed together (up to 500 per write).
+_offer_batcher = _WriteBatcher(lambda a: (_offer_doc(a), a), _write_offers)
+_trust_batcher = _WriteBatcher(_trust_doc, _write_trusts)
+
+
+def index_offer(activity: dict) -> "asyncio.Future[Dict[str, Any]]":
+    """Index an Offer activity into the hub_offers collection.
+
+    The activity is normalized immediately, so a malformed one raises at call
+    time; the returned future resolves once the write, batched with concurrent
+    calls (see _WriteBatcher), is acknowledged.
+    """
+    return _offer_batcher.submit(activity)
+
+
+def index_trust(activity: dict) -> "asyncio.Future[Dict[str, Any] | None]":
+    """Index a fedmarket:Trust activity into the hub_trust_log collection.
+
+    Like index_offer: normalization errors raise at call time and the returned
+    future resolves once the batched write is acknowledged.
+
+    Returns:
+        Future of the normalized trust document, or of None if activity type
+        is not Trust.
+    """
+    if activity.get("type") != "fedmarket:Trust":
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+    return _trust_batcher.submit(activity)
+
+
+async def get_offer_source(offer_id: str) -> Dict[str, Any] | None:
+    """Return the original activity an offer was indexed from, if stored."""
+    doc = await db.hub_offers_source.find_one({"id": offer_id}, {"_id": 0, "activity": 1})
+    return doc["activity"] if doc else None
+
+
+async def rebuild_trust_scores(targets: List[str] | None = None) -> None:
+    """Recompute hub_trust_scores (per-target weight sum and count) from the log.
+
+    Used to backfill the precomputed scores for trust links indexed before they
+    were maintained on write, or to repair drift. When targets is given only
+    their scores are recomputed.
+    """
+    pipeline: List[Dict[str, Any]] = [
+        {"$group": {"_id": "$target", "sum": {"$sum": "$weight"}, "count": {"$sum": 1}}},
+        {"$merge": {"into": "hub_trust_scores", "whenMatched": "replace"}},
+    ]
+    if targets is not None:
+        pipeline.insert(0, {"$match": {"target": {"$in": targets}}})
+    await db.hub_trust_log.aggregate(pipeline).to_list(length=None)
+
+
+@cache_service.cached("trust", 60)
 async def _seller_reputation(seller: str) -> float:
     """Compute a reputation score for a seller using the trust graph if present.
 
     Fallback to a neutral 0.5 when the trust service is unavailable or errors
-    occur. The returned value is constrained to [0.0, 1.0].
+    occur. The returned value is constrained to [0.0, 1.0]. Results are cached
+    per seller for 60s and dropped whenever a trust link is indexed.
     """
     try:
         if _compute_trust_path is None:
@@ -101,59 +465,243 @@ async def _seller_reputation(seller: str) -> float:
         # Bound score into [0,1] and soften extremes
         score = max(0.0, min(1.0, float(score)))
         return 0.5 + (score - 0.5) * 0.8
-    except Exception:
+    except Exception as e:
+        log.warning("Не удалось вычислить репутацию %s: %s", seller, e)
         return 0.5
 
 
+async def _reputations(sellers: Iterable[str]) -> Dict[str, float]:
+    """Return the reputation of each distinct seller, computed concurrently."""
+    sellers = list(sellers)
+    return dict(zip(sellers, await asyncio.gather(*[_seller_reputation(s) for s in sellers])))
+
+
+def _rank_score(price: float, reputation: float) -> float:
+    """Blend price and seller reputation; lower is better.
+
+    The higher the trust, the lower the multiplier, so trust can offset price
+    slightly in ordering.
+    """
+    return price * (1.5 - reputation)
+
+
+# Set once every stored offer is known to carry a rank_score; until then
+# searches rank in an aggregation that defaults it (see _DEFAULT_RANK).
+_all_ranked = False
+
+
+async def ensure_rank_scores() -> None:
+    """Store reputation and rank_score on offers indexed before they existed."""
+    global _all_ranked
+    if await db.hub_offers.find_one({"rank_score": {"$exists": False}}, {"_id": 1}):
+        await refresh_reputation_scores()
+    _all_ranked = True
+
+
+async def refresh_reputation_scores(sellers: List[str] | None = None) -> None:
+    """Store current seller reputation and rank_score on their offers.
+
+    Args:
+        sellers: Sellers to refresh; None refreshes every seller in hub_offers.
+    """
+    if sellers is None:
+        sellers = await db.hub_offers.distinct("seller")
+    if not sellers:
+        return
+    reputation = await _reputations(sellers)
+    ops = [
+        # Pipeline update: rank_score depends on each offer's own price
+        UpdateMany(
+            {"seller": seller},
+            [{"$set": {"reputation_score": r, "rank_score": {"$multiply": ["$price", 1.5 - r]}}}],
+        )
+        for seller, r in reputation.items()
+    ]
+    await db.hub_offers.bulk_write(ops, ordered=False)
+    # Search results are derived from the stored ranking
+    await cache_service.clear("offers")
+
+
+# Offers carry a precomputed rank_score, so plain searches are sorted (and,
+# with the rank_score indexes, walked in order) by Mongo itself.
+_SEARCH_SORT = [("rank_score", 1)]
+
+# $text only matches whole word tokens; queries without any word character
+# (e.g. "$" or "++") fall back to a regex match.
+_WORD_RE = re.compile(r"\w")
+
+
+def _search_filter(
+    q: str | None,
+    tag: str | None,
+    min_price: float | None,
+    max_price: float | None,
+    substring: bool = False,
+) -> Dict[str, Any]:
+    """Build the Mongo filter for search_products from bound parameters.
+
+    Clauses are always emitted in the same order so equivalent requests produce
+    the same query shape and reuse Mongo's cached plan.
+
+    The regex fallback is an escaped, anchored prefix over the lowercased name
+    and description, each answered by its index with a range scan.
+
+    With substring set, q is matched inside the text rather than as keywords.
+    Queries of 3+ characters are pre-filtered by the trigram index and only
+    the candidates are verified with an unanchored regex. Shorter ones match
+    as a word prefix via the phraselist index; if they contain no words, the
+    regex runs as a full scan.
+    """
+    query: Dict[str, Any] = {}
+    lowered = q.lower() if q else ""
+    phrase = _phrase(lowered) if substring and len(lowered) < 3 else ""
+    if substring and len(lowered) >= 3:
+        query["trigrams"] = {"$all": _query_trigrams(lowered)}
+        pattern = re.escape(lowered)
+        query["$or"] = [
+            {"name_lower": {"$regex": pattern}},
+            {"description_lower": {"$regex": pattern}},
+        ]
+    elif phrase:
+        query["phraselist"] = {"$regex": f"^{re.escape(phrase)}"}
+    elif q:
+        if _WORD_RE.search(q):
+            query["$text"] = {"$search": q}
+        else:
+            pattern = re.escape(q.lower())
+            if not substring:
+                pattern = f"^{pattern}"
+            query["$or"] = [
+                {"name_lower": {"$regex": pattern}},
+                {"description_lower": {"$regex": pattern}},
+            ]
+    if tag:
+        query["tags"] = tag.lstrip("#")
+    if min_price is not None or max_price is not None:
+        price: Dict[str, float] = {}
+        if min_price is not None:
+            price["$gte"] = min_price
+        if max_price is not None:
+            price["$lte"] = max_price
+        query["price"] = price
+    return query
+
+
 async def search_products(
     q: str | None = None,
     tag: str | None = None,
     min_price: float | None = None,
     max_price: float | None = None,
     limit: int = 20,
+    substring: bool = False,
 ) -> List[Dict[str, Any]]:
     """Search products with optional text, tag, and price filters.
 
-    Applies a simple ranking that incorporates price and seller reputation so
-    that higher trust can offset price slightly in ordering.
+    Results are ordered by the stored rank_score, which blends price and seller
+    reputation. Keyword matches additionally divide it by their text relevance,
+    and offers not ranked yet get a neutral one; both are done in an
+    aggregation, the common case is an index-ordered find.
     """
-    query: Dict[str, Any] = {}
-    if q:
+    query = _search_filter(q, tag, min_price, max_price, substring)
+    if "$text" not in query:
+        if _all_ranked:
+            cursor = db.hub_offers.find(query, _SEARCH_RESULT_PROJECTION)
+            return await cursor.sort(_SEARCH_SORT).limit(limit).to_list(length=limit)
+        return await _ranked_search(query, _DEFAULT_RANK, limit)
+
+    try:
+        # More relevant keyword matches rank higher (textScore > 0)
+        rank = {"$divide": [_DEFAULT_RANK, {"$meta": "textScore"}]}
+        return await _ranked_search(query, rank, limit)
+    except OperationFailure:
+        # Text index not built yet (or its build failed): match the keywords
+        # case-insensitively instead, as a plain regex over the stored fields
+        del query["$text"]
+        pattern = re.escape(q or "")
         query["$or"] = [
-            {"name": {"$regex": q, "$options": "i"}},
-            {"description": {"$regex": q, "$options": "i"}},
+            {"name": {"$regex": pattern, "$options": "i"}},
+            {"description": {"$regex": pattern, "$options": "i"}},
         ]
-    if tag:
-        query["tags"] = tag.lstrip("#")
-    if min_price is not None:
-        query["price"] = {"$gte": min_price}
-    if max_price is not None:
-        query["price"] = {**query.get("price", {}), "$lte": max_price}
+        return await _ranked_search(query, _DEFAULT_RANK, limit)
 
-    cursor = db.hub_offers.find(query).sort("price", 1).limit(limit)
-    products = await cursor.to_list(length=limit)
 
-    # Rank by a blended metric of price and seller reputation
-    for p in products:
-        trust_score = await _seller_reputation(p["seller"])
-        p["reputation_score"] = trust_score
-        # The higher the trust, the lower the rank_score multiplier -> better rank
-        p["rank_score"] = p["price"] * (1.5 - trust_score)
+async def _ranked_search(query: Dict[str, Any], rank: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+    """Return the best offers matching query, ranked by the rank expression."""
+    pipeline = [
+        {"$match": query},
+        {"$addFields": {"rank_score": rank}},
+        {"$sort": {"rank_score": 1}},  # ascending -> best first
+        {"$limit": limit},
+        {"$project": _SEARCH_RESULT_PROJECTION},
+    ]
+    return await db.hub_offers.aggregate(pipeline).to_list(length=limit)
+
+
+# One pooled client for all replication traffic, so deliveries to the same
+# peer reuse keep-alive connections instead of a new TCP/TLS handshake each.
+# With HTTP/2 (negotiated via ALPN on TLS peers) concurrent deliveries to a
+# peer are multiplexed over a single connection.
+_client: httpx.AsyncClient | None = None
+
+# Deliveries in flight across all replications; keeps fan-out to many peers
+# from tripping remote rate limits or exhausting local file descriptors.
+_REPLICATION_CONCURRENCY = 16
+_replication_slots = asyncio.Semaphore(_REPLICATION_CONCURRENCY)
 
-    products.sort(key=lambda x: x["rank_score"])  # ascending -> best first
-    return products
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared replication client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=_HTTP2,
+            timeout=10,
+            # Pool sized to the delivery concurrency, plus headroom
+            limits=httpx.Limits(
+                max_connections=2 * _REPLICATION_CONCURRENCY,
+                max_keepalive_connections=2 * _REPLICATION_CONCURRENCY,
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Close the shared replication client, if one was created."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+_JSON_HEADERS = {"content-type": "application/json"}
+
+
+async def _deliver(client: httpx.AsyncClient, domain: str, payload: bytes) -> httpx.Response:
+    """POST a serialized activity to a peer's hub inbox within the concurrency limit."""
+    async with _replication_slots:
+        return await client.post(f"{domain}/hub/inbox", content=payload, headers=_JSON_HEADERS)
 
 
 async def replicate_to_peers(activity: dict) -> None:
     """Replicate an accepted activity to all active hubs from the registry.
 
-    Errors during delivery are logged but do not stop the replication loop.
+    Peers are contacted concurrently, at most 16 deliveries at a time. Errors
+    during delivery are logged but do not affect delivery to the other peers.
     """
-    hubs = load_hubs()
-    async with httpx.AsyncClient() as client:
-        for hub in hubs:
-            if hub.get("active") and hub.get("domain") != config.HUB_DOMAIN:
-                try:
-                    await client.post(f"{hub['domain']}/hub/inbox", json=activity, timeout=10)
-                except Exception as e:  # noqa: BLE001 - keep replication resilient
-                    print(f"❌ Не удалось реплицировать в {hub['domain']}: {e}")
+    peers = [
+        hub["domain"]
+        for hub in load_hubs()
+        if hub.get("active") and hub.get("domain") and hub["domain"] != config.HUB_DOMAIN
+    ]
+    if not peers:
+        return
+    client = _get_client()
+    # Serialized once for all peers instead of by httpx per request
+    payload = orjson.dumps(activity)
+    results = await asyncio.gather(
+        *[_deliver(client, domain, payload) for domain in peers],
+        return_exceptions=True,
+    )
+    for domain, result in zip(peers, results):
+        if isinstance(result, Exception):
+            log.warning("❌ Не удалось реплицировать в %s: %s", domain, result)
@@ -4,6 +4,10 @@ The real TON client (tonutils) may not be available in all environments. This
 module provides minimal stubs and typed docstrings so the application can run
 without blockchain dependencies while keeping a clear upgrade path.
 """
+import os
+import time
+import uuid
+from decimal import ROUND_DOWN, Decimal
 from typing import Optional
 
 # Safe import: tonutils can be missing in the environment
@@ -30,15 +34,34 @@ except Exception:  # noqa: E722 - silence any import error to keep app functiona
             # The stub returns a fixed, clearly-fake address.
             return cls(client=client, address="UQ_FAKE_ADDRESS")
 
-    def to_nano(amount_ton: float) -> int:
-        """Convert TON to nanoTON with defensive casting."""
+    def to_nano(amount_ton: "str | int | float | Decimal") -> int:
+        """Convert TON to nanoTON with defensive casting.
+
+        Uses exact decimal arithmetic (fractions below 1 nanoTON are truncated)
+        instead of a float multiplication that drifts around 1e-9 TON.
+        """
+        if isinstance(amount_ton, int):
+            return amount_ton * 1_000_000_000
         try:
-            return int(float(amount_ton) * 1_000_000_000)
+            nano = Decimal(str(amount_ton)).scaleb(9)
+            return int(nano.to_integral_value(rounding=ROUND_DOWN))
         except Exception:
             return 0
 
 from config import TON_API_KEY, TON_WALLET_MNEMONIC
 
+try:
+    # Python 3.14+
+    from uuid import uuid7  # type: ignore[attr-defined]
+except ImportError:
+
+    def uuid7() -> uuid.UUID:
+        """Return a time-ordered UUIDv7 (RFC 9562): 48-bit ms timestamp + 74 random bits."""
+        value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+        value = (value & ~(0xF << 76)) | (0x7 << 76)  # version 7
+        value = (value & ~(0x3 << 62)) | (0x2 << 62)  # RFC 4122 variant
+        return uuid.UUID(int=value)
+
 
 async def confirm_delivery(deal_id: str) -> dict:
     """Simulate releasing funds for a completed deal.
@@ -100,10 +123,12 @@ class TONPaymentService:
         if not isinstance(timeout_days, int) or timeout_days <= 0:
             raise ValueError("timeout_days must be a positive integer")
 
-        amount_nano = to_nano(amount_ton_num)
+        # Convert the caller's value, not its float, so "0.000000001" stays exact
+        amount_nano = to_nano(amount_ton)
         # In reality this would be a smart-contract call. Here we return a stub.
         return {
-            "deal_id": f"deal_{abs(hash((buyer_address, amount_nano, timeout_days)))%10_000_000}",
+            # Unique and time-ordered, so new deals append to the deal_id index
+            "deal_id": f"deal_{uuid7().hex}",
             "buyer": buyer_address,
             "seller": getattr(self.wallet, "address", "UQ_FAKE_ADDRESS"),
             "amount_ton": amount_ton_num,
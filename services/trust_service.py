@@ -1,10 +1,10 @@
 """Trust graph utilities for computing trust-based scores.
 
 Implements basic operations over a trust log stored in MongoDB. The algorithm is
-simple by design and uses bounded recursion with dampening to prevent runaway
-values while still capturing multi-hop trust.
+simple by design and uses a bounded number of hops with dampening to prevent
+runaway values while still capturing multi-hop trust.
 """
-from typing import Dict, List
+from typing import Any, Dict, List, Tuple
 
 from database import db
 
@@ -23,7 +23,11 @@ async def add_trust(source: str, target: str, weight: float) -> Dict[str, object
         "weight": max(0.1, min(1.0, float(weight))),  # clamp and coerce
         "timestamp": "2025-04-05T12:00:00Z",
     }
-    await db.trust_log.insert_one(trust_doc)
+    # One edge per (source, target), enforced by a unique index: re-issuing
+    # trust replaces the previous weight
+    await db.trust_log.update_one(
+        {"source": source, "target": target}, {"$set": trust_doc}, upsert=True
+    )
     return trust_doc
 
 
@@ -33,37 +37,127 @@ async def get_direct_trust(source: str, target: str) -> float:
     return float(doc["weight"]) if doc else 0.0
 
 
-async def compute_trust_score(source: str, target: str, depth: int = 3) -> float:
+async def _load_edges(source: str, depth: int) -> Dict[str, List[Tuple[str, float]]]:
+    """Load the trust edges within depth hops of source in a single aggregation.
+
+    The first-hop edges are grouped into one document whose targets seed a
+    single $graphLookup, so the whole frontier is expanded hop by hop on the
+    server and every reachable edge is returned once.
+
+    Returns:
+        Adjacency map source -> [(target, weight)] in log order.
+    """
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": {"source": source}},
+        {
+            "$group": {
+                "_id": None,
+                "edges": {"$push": {"_id": "$_id", "source": "$source", "target": "$target", "weight": "$weight"}},
+                "frontier": {"$addToSet": "$target"},
+            }
+        },
+    ]
+    if depth > 1:
+        # Edges leaving the first-hop targets, up to depth hops from source
+        pipeline.append(
+            {
+                "$graphLookup": {
+                    "from": "trust_log",
+                    "startWith": "$frontier",
+                    "connectFromField": "target",
+                    "connectToField": "source",
+                    "maxDepth": depth - 2,
+                    "as": "reach",
+                }
+            }
+        )
+    pipeline.append(
+        {"$project": {"_id": 0, "edges": 1, "reach._id": 1, "reach.source": 1, "reach.target": 1, "reach.weight": 1}}
+    )
+
+    adj: Dict[str, List[Tuple[str, float]]] = {}
+    seen = set()
+    async for doc in db.trust_log.aggregate(pipeline):
+        for edge in [*doc["edges"], *doc.get("reach", ())]:
+            # A cycle back to source returns its edges in reach as well
+            if edge["_id"] in seen:
+                continue
+            seen.add(edge["_id"])
+            adj.setdefault(edge["source"], []).append((edge["target"], float(edge["weight"])))
+    return adj
+
+
+async def compute_trust_score(
+    source: str, target: str, depth: int = 3, threshold: float | None = None
+) -> float:
     """Compute a trust score from source to target via damped multi-hop paths.
 
-    The recursion explores outgoing edges up to a limited depth and applies
-    a decay factor to favor shorter/stronger paths and prevent inflation.
+    Outgoing edges are explored up to a limited depth and a decay factor is
+    applied to favor shorter/stronger paths and prevent inflation. A direct
+    edge to target always wins over relayed paths.
+
+    The reachable subgraph is loaded once and scored iteratively, one hop at a
+    time, so each node is evaluated once per hop instead of once per path.
+
+    Args:
+        threshold: If given, return as soon as the score is known to reach it;
+            the value returned then is at least threshold but may be below the
+            exact score.
     """
-    if depth == 0:
+    if depth <= 0:
         return 0.0
     if source == target:
         return 1.0
 
-    direct = await get_direct_trust(source, target)
-    if direct > 0:
-        return float(direct)
-
-    # Explore via relays with dampening
-    total_trust = 0.0
-    async for relay in db.trust_log.find({"source": source}):
-        relay_weight = float(relay["weight"])  # weight in [0,1]
-        path_trust = await compute_trust_score(relay["target"], target, depth - 1)
-        if path_trust > 0:
-            # Multiply weights along the path and apply additional damping (0.8)
-            total_trust = max(total_trust, relay_weight * path_trust * 0.8)
-
-    return float(total_trust)
+    # A direct edge decides the score alone; one point lookup avoids loading
+    # the subgraph at all
+    direct_weight = await get_direct_trust(source, target)
+    if direct_weight > 0:
+        return direct_weight
+
+    adj = await _load_edges(source, depth)
+    direct: Dict[str, float] = {}
+    for node, edges in adj.items():
+        for relay, weight in edges:
+            if relay == target:
+                direct.setdefault(node, weight)
+
+    # score[node]: best trust from node to target using at most `hops` edges
+    score: Dict[str, float] = {}
+    for _ in range(depth):
+        nxt: Dict[str, float] = {target: 1.0}
+        for node, edges in adj.items():
+            if node == target:
+                continue
+            if direct.get(node, 0.0) > 0:
+                nxt[node] = direct[node]
+                continue
+            # Explore via relays with dampening
+            best = 0.0
+            for relay, weight in edges:
+                path_trust = score.get(relay, 0.0)
+                if path_trust > 0:
+                    # Multiply weights along the path and apply additional damping (0.8)
+                    best = max(best, weight * path_trust * 0.8)
+            if best > 0:
+                nxt[node] = best
+        if nxt == score:
+            # Fixpoint: further hops cannot change any score
+            break
+        score = nxt
+        # Scores only grow with more hops, so reaching the threshold is final
+        if threshold is not None and score.get(source, 0.0) >= threshold:
+            break
+
+    return float(score.get(source, 0.0))
 
 
 async def is_spam_report(reporter: str, target: str) -> bool:
     """Check if the reporter has enough trust to report the target.
 
-    Uses a threshold over the computed trust score.
+    Uses a threshold over the computed trust score; the traversal stops as soon
+    as the threshold is reached.
     """
-    trust_score = await compute_trust_score(reporter, target)
-    return trust_score >= 0.3  # порог
+    threshold = 0.3  # порог
+    trust_score = await compute_trust_score(reporter, target, threshold=threshold)
+    return trust_score >= threshold